@@ -189,12 +189,16 @@ def bsp_key_derivation(shared_secret: bytes, key_type: int, key_length: int, hos
     host_id_lv = bertlv_encode_len(len(host_id)) + host_id
     eid_lv = bertlv_encode_len(len(eid)) + eid
     shared_info = bytes([key_type, key_length]) + host_id_lv + eid_lv
-    logger.debug("kdf_shared_info: %s", b2h(shared_info))
+    # only render the hex dumps if they are actually going to be logged
+    debug = logger.isEnabledFor(logging.DEBUG)
+    if debug:
+        logger.debug("kdf_shared_info: %s", b2h(shared_info))
 
     # X9.63 Key Derivation Function with SHA256
     xkdf = X963KDF(algorithm=hashes.SHA256(), length=l*3, sharedinfo=shared_info)
     out = xkdf.derive(shared_secret)
-    logger.debug("kdf_out: %s", b2h(out))
+    if debug:
+        logger.debug("kdf_out: %s", b2h(out))
 
     initial_mac_chaining_value = out[0:l]
     s_enc = out[l:2*l]
@@ -209,7 +213,9 @@ class BspInstance:
     then the user can call any number of encrypt_and_mac cycles to protect plaintext and
     generate the respective ciphertext."""
     def __init__(self, s_enc: bytes, s_mac: bytes, initial_mcv: bytes):
-        logger.debug("%s(s_enc=%s, s_mac=%s, initial_mcv=%s)", self.__class__.__name__, b2h(s_enc), b2h(s_mac), b2h(initial_mcv))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("%s(s_enc=%s, s_mac=%s, initial_mcv=%s)", self.__class__.__name__,
+                         b2h(s_enc), b2h(s_mac), b2h(initial_mcv))
         self.c_algo = BspAlgoCryptAES128(s_enc)
         self.m_algo = BspAlgoMacAES128(s_mac, initial_mcv)
 
@@ -5,12 +5,18 @@
 
 import json
 import abc
+import re
 import string
 import datetime
 import argparse
+import functools
+import ipaddress
 from io import BytesIO
 from typing import Optional, List, Dict, Any, Tuple, NewType, Union
 
+from Cryptodome.Cipher import AES
+from Cryptodome.Util.strxor import strxor # pylint: disable=no-name-in-module
+
 # Copyright (C) 2009-2010  Sylvain Munaut <tnt@246tNt.com>
 # Copyright (C) 2021 Harald Welte <laforge@osmocom.org>
 #
@@ -34,6 +40,9 @@ SwHexstr = NewType('SwHexstr', str)
 SwMatchstr = NewType('SwMatchstr', str)
 ResTuple = Tuple[Hexstr, SwHexstr]
 
+# pre-computed two-nibble hex representation of every byte value
+_HEX = tuple('%02x' % i for i in range(256))
+
 def h2b(s: Hexstr) -> bytearray:
     """convert from a string of hex nibbles to a sequence of bytes"""
     return bytearray.fromhex(s)
@@ -41,30 +50,37 @@ def h2b(s: Hexstr) -> bytearray:
 
 def b2h(b: bytearray) -> Hexstr:
     """convert from a sequence of bytes to a string of hex nibbles"""
-    return ''.join(['%02x' % (x) for x in b])
+    return bytes(b).hex()
+
+
+def _fromhex_pairs(s: Hexstr) -> bytes:
+    """convert all complete pairs of hex nibbles in a string to bytes; a trailing odd nibble
+    is ignored and, unlike bytes.fromhex(), whitespace is rejected"""
+    n = len(s) & ~1
+    b = bytes.fromhex(s[:n])
+    if len(b) * 2 != n:
+        raise ValueError('non-hexadecimal number found in %s' % s)
+    return b
 
 
 def h2i(s: Hexstr) -> List[int]:
     """convert from a string of hex nibbles to a list of integers"""
-    return [(int(x, 16) << 4)+int(y, 16) for x, y in zip(s[0::2], s[1::2])]
+    return list(_fromhex_pairs(s))
 
 
 def i2h(s: List[int]) -> Hexstr:
     """convert from a list of integers to a string of hex nibbles"""
-    return ''.join(['%02x' % (x) for x in s])
+    return bytes(s).hex()
 
 
 def h2s(s: Hexstr) -> str:
     """convert from a string of hex nibbles to an ASCII string"""
-    return ''.join([chr((int(x, 16) << 4)+int(y, 16)) for x, y in zip(s[0::2], s[1::2])
-                    if int(x + y, 16) != 0xff])
+    return _fromhex_pairs(s).replace(b'\xff', b'').decode('latin-1')
 
 
 def s2h(s: str) -> Hexstr:
     """convert from an ASCII string to a string of hex nibbles"""
-    b = bytearray()
-    b.extend(map(ord, s))
-    return b2h(b)
+    return s.encode('latin-1').hex()
 
 
 def i2s(s: List[int]) -> str:
@@ -74,7 +90,44 @@ def i2s(s: List[int]) -> str:
 
 def swap_nibbles(s: Hexstr) -> Hexstr:
     """swap the nibbles in a hex string"""
-    return ''.join([x+y for x, y in zip(s[1::2], s[0::2])])
+    n = len(s) & ~1
+    try:
+        a = s.encode('ascii')
+    except UnicodeEncodeError:
+        return ''.join([x+y for x, y in zip(s[1::2], s[0::2])])
+    # swap odd/even characters using (C-level) extended slice assignment
+    res = bytearray(n)
+    res[0::2] = a[1:n:2]
+    res[1::2] = a[0:n:2]
+    return res.decode('ascii')
+
+
+# byte translation table swapping the two nibbles of each byte
+_NIBBLE_SWAP = bytes(((i & 0x0f) << 4) | (i >> 4) for i in range(256))
+# the characters for which a hex string survives a bytes.fromhex()/.hex() round trip unchanged
+_LOWER_HEXDIGITS = b'0123456789abcdef'
+
+def _bcd_decode(b: bytes) -> str:
+    """decode nibble-swapped BCD digits, removing any trailing 'f' padding"""
+    return b.translate(_NIBBLE_SWAP).rstrip(b'\xff').hex().rstrip('f')
+
+
+def _bcd_decode_hexstr(s: Hexstr) -> str:
+    """same as swap_nibbles(s).rstrip('f'), but decoding via bytes wherever that gives the
+    identical result, i.e. for even-length lower-case hex strings"""
+    if len(s) & 1 or s.encode('ascii', 'replace').translate(None, _LOWER_HEXDIGITS):
+        return swap_nibbles(s).rstrip('f')
+    return _bcd_decode(bytes.fromhex(s))
+
+
+def _bcd_encode(digits: str, octets: int) -> Hexstr:
+    """encode digits as nibble-swapped BCD, padded with 'f' to the given number of octets; same
+    as swap_nibbles(rpad(digits, octets * 2)), but via bytes wherever that gives the identical
+    result, i.e. for even-length lower-case hex strings"""
+    padded = rpad(digits, octets * 2)
+    if len(padded) & 1 or padded.encode('ascii', 'replace').translate(None, _LOWER_HEXDIGITS):
+        return swap_nibbles(padded)
+    return bytes.fromhex(padded).translate(_NIBBLE_SWAP).hex()
 
 
 def rpad(s: str, l: int, c='f') -> str:
@@ -105,6 +158,10 @@ def half_round_up(n: int) -> int:
     return (n + 1)//2
 
 
+_SANITIZE_CHARS_TO_KEEP = string.digits + string.ascii_letters + string.punctuation
+# byte translation table mapping every ASCII character not kept by str_sanitize to ' '
+_SANITIZE_TABLE = bytes(c if chr(c) in _SANITIZE_CHARS_TO_KEEP else 0x20 for c in range(256))
+
 def str_sanitize(s: str) -> str:
     """replace all non printable chars, line breaks and whitespaces, with ' ', make sure that
     there are no whitespaces at the end and at the beginning of the string.
@@ -115,8 +172,9 @@ def str_sanitize(s: str) -> str:
             filtered result of string 's'
     """
 
-    chars_to_keep = string.digits + string.ascii_letters + string.punctuation
-    res = ''.join([c if c in chars_to_keep else ' ' for c in s])
+    if s.isascii():
+        return s.encode('ascii').translate(_SANITIZE_TABLE).decode('ascii').strip()
+    res = ''.join([c if c in _SANITIZE_CHARS_TO_KEEP else ' ' for c in s])
     return res.strip()
 
 #########################################################################
@@ -141,8 +199,11 @@ def comprehensiontlv_parse_tag_raw(binary: bytes) -> Tuple[int, bytes]:
         return (tag, binary[1:])
 
 
-def comprehensiontlv_parse_tag(binary: bytes) -> Tuple[dict, bytes]:
-    """Parse a single Tag according to ETSI TS 101 220 Section 7.1.1"""
+def _comprehensiontlv_parse_tag(binary: bytes) -> Tuple[dict, int]:
+    """Parse a single Tag according to ETSI TS 101 220 Section 7.1.1 without slicing the input.
+    Returns:
+            Tuple of (tag:dict, number of tag octets:int)
+    """
     if binary[0] in [0x00, 0x80, 0xff]:
         raise ValueError("Found illegal value 0x%02x in %s" %
                          (binary[0], binary))
@@ -151,12 +212,18 @@ def comprehensiontlv_parse_tag(binary: bytes) -> Tuple[dict, bytes]:
         tag = (binary[1] & 0x7f) << 8
         tag |= binary[2]
         compr = bool(binary[1] & 0x80)
-        return ({'comprehension': compr, 'tag': tag}, binary[3:])
+        return ({'comprehension': compr, 'tag': tag}, 3)
     else:
         # single byte tag
         tag = binary[0] & 0x7f
         compr = bool(binary[0] & 0x80)
-        return ({'comprehension': compr, 'tag': tag}, binary[1:])
+        return ({'comprehension': compr, 'tag': tag}, 1)
+
+
+def comprehensiontlv_parse_tag(binary: bytes) -> Tuple[dict, bytes]:
+    """Parse a single Tag according to ETSI TS 101 220 Section 7.1.1"""
+    (tagdict, i) = _comprehensiontlv_parse_tag(binary)
+    return (tagdict, binary[i:])
 
 
 def comprehensiontlv_encode_tag(tag) -> bytes:
@@ -190,11 +257,9 @@ def comprehensiontlv_parse_one(binary: bytes) -> Tuple[dict, int, bytes, bytes]:
     Returns:
             Tuple of (tag:dict, len:int, remainder:bytes)
     """
-    (tagdict, remainder) = comprehensiontlv_parse_tag(binary)
-    (length, remainder) = bertlv_parse_len(remainder)
-    value = remainder[:length]
-    remainder = remainder[length:]
-    return (tagdict, length, value, remainder)
+    (tagdict, i) = _comprehensiontlv_parse_tag(binary)
+    (length, i) = _bertlv_parse_len(binary, i)
+    return (tagdict, length, binary[i:i+length], binary[i+length:])
 
 
 #########################################################################
@@ -226,18 +291,18 @@ def bertlv_parse_tag_raw(binary: bytes) -> Tuple[int, bytes]:
         return tag, binary[i:]
 
 
-def bertlv_parse_tag(binary: bytes) -> Tuple[dict, bytes]:
-    """Parse a single Tag value according to ITU-T X.690 8.1.2
+def _bertlv_parse_tag(binary: bytes) -> Tuple[dict, int]:
+    """Parse a single Tag value according to ITU-T X.690 8.1.2 without slicing the input.
     Args:
             binary : binary input data of BER-TLV length field
     Returns:
-            Tuple of ({class:int, constructed:bool, tag:int}, remainder:bytes)
+            Tuple of ({class:int, constructed:bool, tag:int}, number of tag octets:int)
     """
     cls = binary[0] >> 6
     constructed = bool(binary[0] & 0x20)
     tag = binary[0] & 0x1f
     if tag <= 30:
-        return ({'class': cls, 'constructed': constructed, 'tag': tag}, binary[1:])
+        return ({'class': cls, 'constructed': constructed, 'tag': tag}, 1)
     else:  # multi-byte tag
         tag = 0
         i = 1
@@ -247,7 +312,18 @@ def bertlv_parse_tag(binary: bytes) -> Tuple[dict, bytes]:
             tag <<= 7
             tag |= binary[i] & 0x7f
             i += 1
-        return ({'class': cls, 'constructed': constructed, 'tag': tag}, binary[i:])
+        return ({'class': cls, 'constructed': constructed, 'tag': tag}, i)
+
+
+def bertlv_parse_tag(binary: bytes) -> Tuple[dict, bytes]:
+    """Parse a single Tag value according to ITU-T X.690 8.1.2
+    Args:
+            binary : binary input data of BER-TLV length field
+    Returns:
+            Tuple of ({class:int, constructed:bool, tag:int}, remainder:bytes)
+    """
+    (tagdict, i) = _bertlv_parse_tag(binary)
+    return (tagdict, binary[i:])
 
 
 def bertlv_encode_tag(t) -> bytes:
@@ -303,6 +379,25 @@ def bertlv_encode_tag(t) -> bytes:
         return tag_bytes
 
 
+def _bertlv_parse_len(binary: bytes, offset: int = 0) -> Tuple[int, int]:
+    """Parse a single Length value according to ITU-T X.690 8.1.3 at the given offset without
+    slicing the input; only the definite form is supported here.
+    Args:
+            binary : binary input data containing the BER-TLV length field
+            offset : offset of the length field within 'binary'
+    Returns:
+            Tuple of (length, offset of the first octet after the length field)
+    """
+    if binary[offset] < 0x80:
+        return (binary[offset], offset+1)
+    else:
+        num_len_oct = binary[offset] & 0x7f
+        if len(binary) < offset + num_len_oct + 1:
+            return (0, len(binary))
+        length = int.from_bytes(binary[offset+1:offset+1+num_len_oct], 'big')
+        return (length, offset+1+num_len_oct)
+
+
 def bertlv_parse_len(binary: bytes) -> Tuple[int, bytes]:
     """Parse a single Length value according to ITU-T X.690 8.1.3;
     only the definite form is supported here.
@@ -311,17 +406,8 @@ def bertlv_parse_len(binary: bytes) -> Tuple[int, bytes]:
     Returns:
             Tuple of (length, remainder)
     """
-    if binary[0] < 0x80:
-        return (binary[0], binary[1:])
-    else:
-        num_len_oct = binary[0] & 0x7f
-        length = 0
-        if len(binary) < num_len_oct + 1:
-            return (0, b'')
-        for i in range(1, 1+num_len_oct):
-            length <<= 8
-            length |= binary[i]
-        return (length, binary[1+num_len_oct:])
+    (length, i) = _bertlv_parse_len(binary)
+    return (length, binary[i:])
 
 
 def bertlv_encode_len(length: int) -> bytes:
@@ -346,6 +432,24 @@ def bertlv_encode_len(length: int) -> bytes:
         raise ValueError("Length > 32bits not supported")
 
 
+def _write_tlv(buf: bytearray, tag: int, val: bytes):
+    """Append a single BER-TLV IE to the given buffer.
+    Args:
+            buf : buffer to which the encoded IE is appended
+            tag : tag of the IE
+            val : value part of the IE
+    """
+    length = len(val)
+    if 0 <= tag <= 0xff and (tag & 0x1f) != 0x1f and length < 0x80:
+        # single-octet tag and short-form length: the vast majority of DOs
+        buf.append(tag)
+        buf.append(length)
+    else:
+        buf += bertlv_encode_tag(tag)
+        buf += bertlv_encode_len(length)
+    buf += val
+
+
 def bertlv_parse_one(binary: bytes) -> Tuple[dict, int, bytes, bytes]:
     """Parse a single TLV IE at the start of the given binary data.
     Args:
@@ -353,11 +457,9 @@ def bertlv_parse_one(binary: bytes) -> Tuple[dict, int, bytes, bytes]:
     Returns:
             Tuple of (tag:dict, len:int, remainder:bytes)
     """
-    (tagdict, remainder) = bertlv_parse_tag(binary)
-    (length, remainder) = bertlv_parse_len(remainder)
-    value = remainder[:length]
-    remainder = remainder[length:]
-    return (tagdict, length, value, remainder)
+    (tagdict, i) = _bertlv_parse_tag(binary)
+    (length, i) = _bertlv_parse_len(binary, i)
+    return (tagdict, length, binary[i:i+length], binary[i+length:])
 
 
 def dgi_parse_tag_raw(binary: bytes) -> Tuple[int, bytes]:
@@ -413,10 +515,12 @@ def dgi_parse_len(binary: bytes) -> Tuple[int, bytes]:
 
 def enc_imsi(imsi: str):
     """Converts a string IMSI into the encoded value of the EF"""
+    if len(imsi) > 15:
+        raise ValueError('IMSI input value must be at most 15 digits')
     l = half_round_up(
         len(imsi) + 1)  # Required bytes - include space for odd/even indicator
     oe = len(imsi) & 1			# Odd (1) / Even (0)
-    ei = '%02x' % l + swap_nibbles('%01x%s' % ((oe << 3) | 1, rpad(imsi, 15)))
+    ei = _HEX[l] + _bcd_encode('%01x%s' % ((oe << 3) | 1, imsi), 8)
     return ei
 
 
@@ -426,7 +530,7 @@ def dec_imsi(ef: Hexstr) -> Optional[str]:
         return None
     l = int(ef[0:2], 16) * 2		# Length of the IMSI string
     l = l - 1						# Encoded length byte includes oe nibble
-    swapped = swap_nibbles(ef[2:]).rstrip('f')
+    swapped = _bcd_decode_hexstr(ef[2:])
     if len(swapped) < 1:
         return None
     oe = (int(swapped[0]) >> 3) & 1  # Odd (1) / Even (0)
@@ -440,11 +544,13 @@ def dec_imsi(ef: Hexstr) -> Optional[str]:
 
 
 def dec_iccid(ef: Hexstr) -> str:
-    return swap_nibbles(ef).strip('f')
+    return _bcd_decode_hexstr(ef).lstrip('f')
 
 
 def enc_iccid(iccid: str) -> Hexstr:
-    return swap_nibbles(rpad(iccid, 20))
+    if len(iccid) > 20:
+        raise ValueError('ICCID input value must be at most 20 digits')
+    return _bcd_encode(iccid, 10)
 
 def sanitize_iccid(iccid: Union[int, str]) -> str:
     iccid = str(iccid)
@@ -495,12 +601,11 @@ def enc_plmn(mcc: Hexstr, mnc: Hexstr) -> Hexstr:
     elif len(mcc) == 2:
         mcc = "0" + mcc
 
-    return (mcc[1] + mcc[0]) + (mnc[2] + mcc[2]) + (mnc[1] + mnc[0])
+    return f'{mcc[1]}{mcc[0]}{mnc[2]}{mcc[2]}{mnc[1]}{mnc[0]}'
 
 
 def dec_plmn(threehexbytes: Hexstr) -> dict:
     res = {'mcc': "0", 'mnc': "0"}
-    dec_mcc_from_plmn_str(threehexbytes)
     res['mcc'] = dec_mcc_from_plmn_str(threehexbytes)
     res['mnc'] = dec_mnc_from_plmn_str(threehexbytes)
     return res
@@ -510,10 +615,11 @@ def dec_plmn(threehexbytes: Hexstr) -> dict:
 
 
 def dec_mcc_from_plmn(plmn: Hexstr) -> int:
-    ia = h2i(plmn)
-    digit1 = ia[0] & 0x0F		# 1st byte, LSB
-    digit2 = (ia[0] & 0xF0) >> 4  # 1st byte, MSB
-    digit3 = ia[1] & 0x0F		# 2nd byte, LSB
+    # 1st byte LSB, 1st byte MSB, 2nd byte LSB
+    digits = plmn[1] + plmn[0] + plmn[3]
+    if digits.isdigit():
+        return int(digits)
+    digit1, digit2, digit3 = (int(d, 16) for d in digits)
     if digit3 == 0xF and digit2 == 0xF and digit1 == 0xF:
         return 0xFFF  # 4095
     return derive_mcc(digit1, digit2, digit3)
@@ -528,10 +634,12 @@ def dec_mcc_from_plmn_str(plmn: Hexstr) -> str:
 
 
 def dec_mnc_from_plmn(plmn: Hexstr) -> int:
-    ia = h2i(plmn)
-    digit1 = ia[2] & 0x0F		# 3rd byte, LSB
-    digit2 = (ia[2] & 0xF0) >> 4  # 3rd byte, MSB
-    digit3 = (ia[1] & 0xF0) >> 4  # 2nd byte, MSB
+    # 3rd byte LSB, 3rd byte MSB, 2nd byte MSB
+    digits = plmn[5] + plmn[4] + plmn[2]
+    if digits.isdigit():
+        # three-digit MNC
+        return int(digits)
+    digit1, digit2, digit3 = (int(d, 16) for d in digits)
     if digit3 == 0xF and digit2 == 0xF and digit1 == 0xF:
         return 0xFFF  # 4095
     return derive_mnc(digit1, digit2, digit3)
@@ -545,21 +653,21 @@ def dec_mnc_from_plmn_str(plmn: Hexstr) -> str:
     return res.upper().strip("F")
 
 
+# AcT values which are represented by a single bit
+_ACT_BITS = (
+    (1 << 15, "UTRAN"),
+    (1 << 11, "NG-RAN"),
+    (1 <<  6, "GSM COMPACT"),
+    (1 <<  5, "cdma2000 HRPD"),
+    (1 <<  4, "cdma2000 1xRTT"),
+)
+
 def dec_act(twohexbytes: Hexstr) -> List[str]:
-    act_list = [
-        {'bit': 15, 'name': "UTRAN"},
-        {'bit': 11, 'name': "NG-RAN"},
-        {'bit':  6, 'name': "GSM COMPACT"},
-        {'bit':  5, 'name': "cdma2000 HRPD"},
-        {'bit':  4, 'name': "cdma2000 1xRTT"},
-    ]
-    ia = h2i(twohexbytes)
-    u16t = (ia[0] << 8) | ia[1]
-    sel = set()
+    if len(twohexbytes) < 4:
+        raise ValueError('AcT must be (at least) two bytes, got %s' % twohexbytes)
+    u16t = int(twohexbytes[:4], 16)
     # only the simple single-bit ones
-    for a in act_list:
-        if u16t & (1 << a['bit']):
-            sel.add(a['name'])
+    sel = {name for bit, name in _ACT_BITS if u16t & bit}
     # TS 31.102 Section 4.2.5 Table 4.2.5.1
     eutran_bits = u16t & 0x7000
     if eutran_bits in [0x4000, 0x7000]:
@@ -609,10 +717,6 @@ def derive_milenage_opc(ki_hex: Hexstr, op_hex: Hexstr) -> Hexstr:
     """
     Run the milenage algorithm to calculate OPC from Ki and OP
     """
-    from Cryptodome.Cipher import AES
-    # pylint: disable=no-name-in-module
-    from Cryptodome.Util.strxor import strxor
-
     # We pass in hex string and now need to work on bytes
     ki_bytes = bytes(h2b(ki_hex))
     op_bytes = bytes(h2b(op_hex))
@@ -621,14 +725,21 @@ def derive_milenage_opc(ki_hex: Hexstr, op_hex: Hexstr) -> Hexstr:
     return b2h(strxor(opc_bytes, op_bytes))
 
 
+# translation tables from ASCII decimal digits to their (doubled) Luhn digit sums
+_LUHN_SINGLE = bytes.maketrans(b'0123456789', bytes([0, 1, 2, 3, 4, 5, 6, 7, 8, 9]))
+_LUHN_DOUBLE = bytes.maketrans(b'0123456789', bytes([0, 2, 4, 6, 8, 1, 3, 5, 7, 9]))
+
 def calculate_luhn(cc) -> int:
     """
     Calculate Luhn checksum used in e.g. ICCID and IMEI
     """
-    num = list(map(int, str(cc)))
-    check_digit = 10 - sum(num[-2::-2] + [sum(divmod(d * 2, 10))
-                           for d in num[::-2]]) % 10
-    return 0 if check_digit == 10 else check_digit
+    digits = str(cc).encode('ascii', 'replace')
+    if digits and not digits.isdigit():
+        raise ValueError('Luhn input must consist of decimal digits only: %s' % cc)
+    # every second digit, starting with the right-most one, is doubled
+    rev = digits[::-1]
+    total = sum(rev[0::2].translate(_LUHN_DOUBLE)) + sum(rev[1::2].translate(_LUHN_SINGLE))
+    return (10 - total % 10) % 10
 
 def verify_luhn(digits: str):
     """Verify the Luhn check digit; raises ValueError if it is incorrect."""
@@ -739,7 +850,7 @@ def dec_msisdn(ef_msisdn: Hexstr) -> Optional[Tuple[int, int, Optional[str]]]:
     if not bcd_len:
         return (npi, ton, None)
 
-    msisdn = swap_nibbles(b2h(msisdn_lhv[2:][:bcd_len])).rstrip('f')
+    msisdn = _bcd_decode(bytes(msisdn_lhv[2:2+bcd_len]))
     # International number 10.5.118/3GPP TS 24.008
     if ton == 0x01:
         msisdn = '+' + msisdn
@@ -778,10 +889,17 @@ def enc_msisdn(msisdn: str, npi: int = 0x01, ton: int = 0x03) -> Hexstr:
     # BCD length also includes NPI/ToN header
     bcd_len = len(msisdn) // 2 + 1
     npi_ton = (npi & 0x0f) | ((ton & 0x07) << 4) | 0x80
-    bcd = rpad(swap_nibbles(msisdn), 10 * 2)  # pad to 10 octets
+    bcd = _bcd_encode(msisdn, 10)  # pad to 10 octets
+
+    return _HEX[bcd_len] + _HEX[npi_ton] + bcd + ("ff" * 2)
 
-    return ('%02x' % bcd_len) + ('%02x' % npi_ton) + bcd + ("ff" * 2)
 
+_HEXDIGITS = string.hexdigits.encode('ascii')
+
+def _all_hexdigits(s: str) -> bool:
+    """Check if a string consists of hexadecimal digits only."""
+    # deleting all hex digits must leave nothing behind
+    return not s.encode('ascii', 'replace').translate(None, _HEXDIGITS)
 
 def is_hex(string: str, minlen: int = 2, maxlen: Optional[int] = None) -> bool:
     """
@@ -798,12 +916,7 @@ def is_hex(string: str, minlen: int = 2, maxlen: Optional[int] = None) -> bool:
     if maxlen and len(string) > maxlen:
         return False
 
-    # Try actual encoding to be sure
-    try:
-        _try_encode = h2b(string)
-        return True
-    except:
-        return False
+    return _all_hexdigits(string)
 
 
 def sanitize_pin_adm(pin_adm, pin_adm_hex=None) -> Hexstr:
@@ -816,7 +929,7 @@ def sanitize_pin_adm(pin_adm, pin_adm_hex=None) -> Hexstr:
 
     if pin_adm is not None:
         if len(pin_adm) <= 8:
-            pin_adm = ''.join(['%02x' % (ord(x)) for x in pin_adm])
+            pin_adm = pin_adm.encode('latin-1').hex()
             pin_adm = rpad(pin_adm, 16)
 
         else:
@@ -836,6 +949,9 @@ def sanitize_pin_adm(pin_adm, pin_adm_hex=None) -> Hexstr:
     return pin_adm
 
 
+_IPV4_LABEL_RE = re.compile('^[0-9_]+$')
+_FQDN_LABEL_RE = re.compile('^[a-zA-Z0-9]+(?:-[a-zA-Z0-9]+)?$')
+
 def get_addr_type(addr):
     """
     Validates the given address and returns it's type (FQDN or IPv4 or IPv6)
@@ -852,7 +968,6 @@ def get_addr_type(addr):
 
     # Check for IPv4/IPv6
     try:
-        import ipaddress
         # Throws ValueError if addr is not correct
         ipa = ipaddress.ip_address(addr)
 
@@ -861,25 +976,15 @@ def get_addr_type(addr):
         elif ipa.version == 6:
             return 0x02
     except Exception:
-        invalid_ipv4 = True
-        for i in addr_list:
-            # Invalid IPv4 may qualify for a valid FQDN, so make check here
-            # e.g. 172.24.15.300
-            import re
-            if not re.match('^[0-9_]+$', i):
-                invalid_ipv4 = False
-                break
+        # Invalid IPv4 may qualify for a valid FQDN, so make check here
+        # e.g. 172.24.15.300
+        invalid_ipv4 = all(_IPV4_LABEL_RE.match(i) for i in addr_list)
 
         if invalid_ipv4:
             return None
 
-    fqdn_flag = True
-    for i in addr_list:
-        # Only Alpha-numeric characters and hyphen - RFC 1035
-        import re
-        if not re.match("^[a-zA-Z0-9]+(?:-[a-zA-Z0-9]+)?$", i):
-            fqdn_flag = False
-            break
+    # Only Alpha-numeric characters and hyphen - RFC 1035
+    fqdn_flag = all(_FQDN_LABEL_RE.match(i) for i in addr_list)
 
     # FQDN
     if fqdn_flag:
@@ -888,8 +993,30 @@ def get_addr_type(addr):
     return None
 
 
+@functools.lru_cache(maxsize=256)
+def _sw_match_compile(pattern: str) -> Optional[Tuple[int, int]]:
+    """Compile a SW match pattern into a (mask, expected) pair of integers, with the mask
+    covering all bytes of the pattern that are not a '?' or 'x' wildcard.  Returns None
+    for patterns that are not exactly four ASCII characters long."""
+    if len(pattern) != 4 or not pattern.isascii():
+        return None
+    mask = 0
+    expected = 0
+    for c in pattern:
+        mask <<= 8
+        expected <<= 8
+        if c not in '?x':
+            mask |= 0xff
+            expected |= ord(c)
+    return (mask, expected)
+
+
 def sw_match(sw: str, pattern: str) -> bool:
     """Match given SW against given pattern."""
+    compiled = _sw_match_compile(pattern)
+    if compiled and len(sw) >= 4 and sw.isascii():
+        mask, expected = compiled
+        return int.from_bytes(sw[:4].lower().encode('ascii'), 'big') & mask == expected
     # Create a masked version of the returned status word
     sw_lower = sw.lower()
     sw_masked = ""
@@ -925,14 +1052,18 @@ def tabulate_str_list(str_list, width: int = 79, hspace: int = 2, lspace: int =
     cols = width // cellwith
     rows = (len(str_list) - 1) // cols + 1
     table = []
+    if align_left:
+        format_str_cell = '%%-%ds' % cellwith
+    else:
+        format_str_cell = '%%%ds' % cellwith
+    prefix = " " * lspace
+    # rows only differ in their number of cells at the end, so only re-build the row format then
+    format_len = None
     for i in iter(range(rows)):
         str_list_row = str_list[i::rows]
-        if align_left:
-            format_str_cell = '%%-%ds'
-        else:
-            format_str_cell = '%%%ds'
-        format_str_row = (format_str_cell % cellwith) * len(str_list_row)
-        format_str_row = (" " * lspace) + format_str_row
+        if len(str_list_row) != format_len:
+            format_len = len(str_list_row)
+            format_str_row = prefix + format_str_cell * format_len
         table.append(format_str_row % tuple(str_list_row))
     return '\n'.join(table)
 
@@ -972,9 +1103,12 @@ def expand_hex(hexstring, length):
             expanded hexstring
     """
 
+    pos = hexstring.find(".")
+    if pos < 0:
+        return hexstring
+
     # expand digit aligned
-    if hexstring.count(".") == 1:
-        pos = hexstring.index(".")
+    if hexstring.find(".", pos + 1) < 0:
         if pos > 0:
             filler = hexstring[pos - 1]
         else:
@@ -984,15 +1118,14 @@ def expand_hex(hexstring, length):
         if missing <= 0:
             return hexstring
 
-        return hexstring.replace(".", filler * missing)
+        return hexstring[:pos] + filler * missing + hexstring[pos + 1:]
 
     # expand byte aligned
-    elif hexstring.count("..") == 1:
+    pos = hexstring.find("..", pos)
+    if pos >= 0 and hexstring.find("..", pos + 2) < 0:
         if len(hexstring) % 2:
             return hexstring
 
-        pos = hexstring.index("..")
-
         if pos % 2:
             return hexstring
 
@@ -1005,7 +1138,7 @@ def expand_hex(hexstring, length):
         if missing <= 0:
             return hexstring
 
-        return hexstring.replace("..", filler * (missing // 2))
+        return hexstring[:pos] + filler * (missing // 2) + hexstring[pos + 2:]
 
     # no change
     return hexstring
@@ -1014,9 +1147,22 @@ def expand_hex(hexstring, length):
 class JsonEncoder(json.JSONEncoder):
     """Extend the standard library JSONEncoder with support for more types."""
 
+    # handlers for the exact types we support; subclasses take the isinstance() path below
+    _handlers = {
+        bytes: bytes.hex,
+        bytearray: bytearray.hex,
+        BytesIO: lambda o: o.getvalue().hex(),
+        datetime.datetime: datetime.datetime.isoformat,
+    }
+
     def default(self, o):
-        if isinstance(o, (BytesIO, bytes, bytearray)):
+        handler = self._handlers.get(type(o))
+        if handler:
+            return handler(o)
+        if isinstance(o, (bytes, bytearray)):
             return b2h(o)
+        elif isinstance(o, BytesIO):
+            return b2h(o.getvalue())
         elif isinstance(o, datetime.datetime):
             return o.isoformat()
         return json.JSONEncoder.default(self, o)
@@ -1041,6 +1187,10 @@ class DataObject(abc.ABC):
     has the habit of specifying TLV data but with very spcific ordering, or specific choices of
     tags at specific points in a stream.  This class tries to represent this."""
 
+    # store the attributes accessed on every encode/decode in fixed slots rather than
+    # in the per-instance dict
+    __slots__ = ('name', 'desc', 'tag', 'decoded', 'encoded')
+
     def __init__(self, name: str, desc: Optional[str] = None, tag: Optional[int] = None):
         """
         Args:
@@ -1106,22 +1256,44 @@ class DataObject(abc.ABC):
         Returns:
             bytes remaining at end of 'do' after parsing one TLV/DO.
         """
-        if do[0] != self.tag:
+        # return remaining bytes
+        return do[self._from_tlv_at(do, 0):]
+
+    def _from_tlv_at(self, binary: bytes, offset: int) -> int:
+        """Parse the binary TLV representation at the given offset into internal state,
+        without slicing off the remainder.  This is used by both from_tlv() and
+        DataObjectCollection.decode(), so subclasses with a different TLV framing
+        should override this method.
+        Args:
+            binary : input bytes containing TLV-encoded representation
+            offset : offset of the TLV/DO within 'binary'
+        Returns:
+            offset of the first byte after the parsed TLV/DO.
+        """
+        if binary[offset] != self.tag:
             raise ValueError('%s: Can only decode tag 0x%02x' %
                              (self, self.tag))
-        length = do[1]
-        val = do[2:2+length]
-        self.from_bytes(val)
-        # return remaining bytes
-        return do[2+length:]
+        length = binary[offset+1]
+        self.from_bytes(binary[offset+2:offset+2+length])
+        return offset + 2 + length
 
     def to_tlv(self) -> bytes:
         """Encode internal representation to binary TLV.
         Returns:
             bytes encoded in TLV format.
         """
+        return bytes(self.to_tlv_into(bytearray()))
+
+    def to_tlv_into(self, buf: bytearray) -> bytearray:
+        """Encode internal representation to binary TLV, appending it to a caller-supplied buffer.
+        Args:
+            buf : buffer to which the TLV-encoded representation is appended
+        Returns:
+            the buffer passed in as 'buf'
+        """
         val = self.to_bytes()
-        return bertlv_encode_tag(self._compute_tag()) + bertlv_encode_len(len(val)) + val
+        _write_tlv(buf, self._compute_tag(), val)
+        return buf
 
     # 'codec' interface
     def decode(self, binary: bytes) -> Tuple[dict, bytes]:
@@ -1168,10 +1340,13 @@ class DataObjectCollection:
         self.name = name
         self.desc = desc
         self.members = members or []
-        self.members_by_tag = {}
-        self.members_by_name = {}
-        self.members_by_tag = {m.tag: m for m in members}
-        self.members_by_name = {m.name: m for m in members}
+        self.members_by_tag = {m.tag: m for m in self.members}
+        self.members_by_name = {m.name: m for m in self.members}
+        # single-byte tags index directly into a 256-entry table for decoding
+        self._tag_lut = [None] * 256
+        for tag, m in self.members_by_tag.items():
+            if isinstance(tag, int) and 0 <= tag <= 0xff:
+                self._tag_lut[tag] = m
 
     def __str__(self) -> str:
         member_strs = [str(x) for x in self.members]
@@ -1203,29 +1378,42 @@ class DataObjectCollection:
             tuple of (decoded_result, binary_remainder)
         """
         res = []
-        remainder = binary
-        # iterate until no binary trailer is left
-        while len(remainder):
-            tag = remainder[0]
+        res_append = res.append
+        tag_lut = self._tag_lut
+        n = len(binary)
+        i = 0
+        # iterate until no binary trailer is left; walk the input by offset rather than
+        # slicing off the remainder after each DO
+        while i < n:
+            tag = binary[i]
             if tag == 0xff:  # uninitialized memory at the end?
-                return (res, remainder)
-            if not tag in self.members_by_tag:
+                return (res, binary[i:])
+            obj = tag_lut[tag]
+            if obj is None:
                 raise ValueError('%s: Unknown Tag 0x%02x in %s; expected %s' %
-                                 (self, tag, remainder, self.members_by_tag.keys()))
-            obj = self.members_by_tag[tag]
-            # DO from_tlv returns remainder of binary
-            remainder = obj.from_tlv(remainder)
+                                 (self, tag, binary[i:], self.members_by_tag.keys()))
+            i = obj._from_tlv_at(binary, i)
             # collect our results
-            res.append(obj.to_dict())
-        return (res, remainder)
+            res_append(obj.to_dict())
+        return (res, binary[i:])
+
+    def encode_into(self, buf: bytearray, decoded) -> bytearray:
+        """Encode any number of DOs from the collection, appending them to a caller-supplied buffer.
+        Args:
+            buf : buffer to which the encoded DOs are appended
+            decoded : list of {name: decoded_value} dicts, as returned by decode()
+        Returns:
+            the buffer passed in as 'buf'
+        """
+        for i in decoded:
+            obj = self.members_by_name[list(i)[0]]
+            obj.decoded = list(i.values())[0]
+            obj.to_tlv_into(buf)
+        return buf
 
     # 'codec' interface
     def encode(self, decoded) -> bytes:
-        res = bytearray()
-        for i in decoded:
-            obj = self.members_by_name(i[0])
-            res.append(obj.to_tlv())
-        return res
+        return bytes(self.encode_into(bytearray(), decoded))
 
 
 class DataObjectChoice(DataObjectCollection):
@@ -1260,18 +1448,28 @@ class DataObjectChoice(DataObjectCollection):
         tag = binary[0]
         if tag == 0xff:
             return (None, binary)
-        if not tag in self.members_by_tag:
+        obj = self._tag_lut[tag]
+        if obj is None:
             raise ValueError('%s: Unknown Tag 0x%02x in %s; expected %s' %
                              (self, tag, binary, self.members_by_tag.keys()))
-        obj = self.members_by_tag[tag]
         remainder = obj.from_tlv(binary)
         return (obj.to_dict(), remainder)
 
-    # 'codec' interface
-    def encode(self, decoded) -> bytes:
+    def encode_into(self, buf: bytearray, decoded) -> bytearray:
+        """Encode the DO of the choice, appending it to a caller-supplied buffer.
+        Args:
+            buf : buffer to which the encoded DO is appended
+            decoded : {name: decoded_value} dict, as returned by decode()
+        Returns:
+            the buffer passed in as 'buf'
+        """
         obj = self.members_by_name[list(decoded)[0]]
         obj.decoded = list(decoded.values())[0]
-        return obj.to_tlv()
+        return obj.to_tlv_into(buf)
+
+    # 'codec' interface
+    def encode(self, decoded) -> bytes:
+        return bytes(self.encode_into(bytearray(), decoded))
 
 
 class DataObjectSequence:
@@ -1295,12 +1493,24 @@ class DataObjectSequence:
 
     def __add__(self, other) -> 'DataObjectSequence':
         """Add (append) a DataObject or DataObjectChoice to the sequence."""
-        if isinstance(other, 'DataObject'):
+        if isinstance(other, DataObject):
             return DataObjectSequence(self.name, self.desc, self.sequence + [other])
-        elif isinstance(other, 'DataObjectChoice'):
+        elif isinstance(other, DataObjectChoice):
             return DataObjectSequence(self.name, self.desc, self.sequence + [other])
-        elif isinstance(other, 'DataObjectSequence'):
+        elif isinstance(other, DataObjectSequence):
             return DataObjectSequence(self.name, self.desc, self.sequence + other.sequence)
+        else:
+            raise TypeError
+
+    def __iadd__(self, other) -> 'DataObjectSequence':
+        """Add (append) a DataObject or DataObjectChoice to the sequence in-place."""
+        if isinstance(other, (DataObject, DataObjectChoice)):
+            self.sequence.append(other)
+        elif isinstance(other, DataObjectSequence):
+            self.sequence.extend(other.sequence)
+        else:
+            raise TypeError
+        return self
 
     # 'codec' interface
     def decode(self, binary: bytes) -> Tuple[list, bytes]:
@@ -1312,10 +1522,11 @@ class DataObjectSequence:
         """
         remainder = binary
         res = []
+        res_append = res.append
         for e in self.sequence:
             (r, remainder) = e.decode(remainder)
             if r:
-                res.append(r)
+                res_append(r)
         return (res, remainder)
 
     # 'codec' interface
@@ -1327,27 +1538,41 @@ class DataObjectSequence:
             list of results of the decoder of this sequences
         """
         remainder = do
+        remaining = len(remainder)
         res = []
-        while len(remainder):
-            (r, remainder2) = self.decode(remainder)
+        res_append = res.append
+        decode = self.decode
+        while remaining:
+            (r, remainder) = decode(remainder)
             if r:
-                res.append(r)
-            if len(remainder2) < len(remainder):
-                remainder = remainder2
-            else:
-                remainder = remainder2
+                res_append(r)
+            # stop once decoding makes no more progress (e.g. at trailing 0xff padding)
+            if len(remainder) >= remaining:
                 break
+            remaining = len(remainder)
         return (res, remainder)
 
+    def encode_into(self, buf: bytearray, decoded) -> bytearray:
+        """Encode a sequence by calling the encoder of each element in the sequence, appending
+        the result to a caller-supplied buffer.
+        Args:
+            buf : buffer to which the encoded sequence is appended
+            decoded : list of json-serializable input data; one list item per sequence element
+        Returns:
+            the buffer passed in as 'buf'
+        """
+        for i, e in enumerate(self.sequence):
+            if isinstance(e, DataObject):
+                e.decoded = list(decoded[i].values())[0]
+                e.to_tlv_into(buf)
+            else:
+                buf += e.encode(decoded[i])
+        return buf
+
     # 'codec' interface
     def encode(self, decoded) -> bytes:
         """Encode a sequence by calling the encoder of each element in the sequence."""
-        encoded = bytearray()
-        i = 0
-        for e in self.sequence:
-            encoded += e.encode(decoded[i])
-            i += 1
-        return encoded
+        return bytes(self.encode_into(bytearray(), decoded))
 
     def encode_multi(self, decoded) -> bytes:
         """Encode multiple occurrences of the sequence from the decoded input data.
@@ -1358,8 +1583,8 @@ class DataObjectSequence:
         """
         encoded = bytearray()
         for d in decoded:
-            encoded += self.encode(d)
-        return encoded
+            self.encode_into(encoded, d)
+        return bytes(encoded)
 
 
 class CardCommand:
@@ -1370,6 +1595,10 @@ class CardCommand:
         self.ins = ins
         self.cla_list = cla_list or []
         self.cla_list = [x.lower() for x in self.cla_list]
+        # (value, mask) pairs for each CLA in cla_list; 'x' nibbles are masked out
+        self._cla_masks = [(int(m.replace('x', '0'), 16),
+                            int(''.join(['0' if c == 'x' else 'f' for c in m]), 16))
+                           for m in self.cla_list]
         self.desc = desc
 
     def __str__(self):
@@ -1380,17 +1609,10 @@ class CardCommand:
 
     def match_cla(self, cla):
         """Does the given CLA match the CLA list of the command?."""
-        if not isinstance(cla, str):
-            cla = '%02u' % cla
-        cla = cla.lower()
-        for cla_match in self.cla_list:
-            cla_masked = ""
-            for i in range(0, 2):
-                if cla_match[i] == 'x':
-                    cla_masked += 'x'
-                else:
-                    cla_masked += cla[i]
-            if cla_masked == cla_match:
+        if isinstance(cla, str):
+            cla = int(cla, 16)
+        for value, mask in self._cla_masks:
+            if cla & mask == value:
                 return True
         return False
 
@@ -1441,7 +1663,7 @@ def is_hexstr_or_decimal(instr: str) -> str:
     [hexa]decimal digits only."""
     if instr.isdecimal():
         return instr
-    if not all(c in string.hexdigits for c in instr):
+    if not _all_hexdigits(instr):
         raise ValueError('Input must be [hexa]decimal')
     if len(instr) & 1:
         raise ValueError('Input has un-even number of hex digits')
@@ -1450,7 +1672,7 @@ def is_hexstr_or_decimal(instr: str) -> str:
 def is_hexstr(instr: str) -> str:
     """Method that can be used as 'type' in argparse.add_argument() to validate the value consists of
     an even sequence of hexadecimal digits only."""
-    if not all(c in string.hexdigits for c in instr):
+    if not _all_hexdigits(instr):
         raise ValueError('Input must be hexadecimal')
     if len(instr) & 1:
         raise ValueError('Input has un-even number of hex digits')
@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 
+import json
 import unittest
+from io import BytesIO
 from pySim import utils
 from pySim.legacy import utils as legacy_utils
 from pySim.ts_31_102 import EF_SUCI_Calc_Info
@@ -21,6 +23,49 @@ class DoTestCase(unittest.TestCase):
         re_decoded = arr_seq.decode(encoded)
         self.assertEqual(dec_in, re_decoded[0])
 
+    def testCollection(self):
+        """A collection of DOs in arbitrary order and number"""
+        coll = utils.DataObjectCollection('coll', members=[utils.TL0_DataObject('always', 'Always', 0x90),
+                                                           utils.TL0_DataObject('never', 'Never', 0x97)])
+        encoded = b'\x90\x00\x97\x00\x90\x00'
+        decoded = coll.decode(encoded + b'\xff\xff')
+        self.assertEqual(decoded, ([{'always': None}, {'never': None}, {'always': None}], b'\xff\xff'))
+        self.assertEqual(coll.encode(decoded[0]), encoded)
+
+    def testEmptyCollection(self):
+        """A collection constructed without members"""
+        coll = utils.DataObjectCollection('x')
+        self.assertEqual(coll.decode(b''), ([], b''))
+        with self.assertRaises(ValueError):
+            coll.decode(b'\x90\x00')
+        with self.assertRaises(ValueError):
+            utils.DataObjectChoice('y').decode(b'\x90\x00')
+
+    def testSeqAdd(self):
+        """Extending a sequence with DOs, choices and other sequences"""
+        always = utils.TL0_DataObject('always', 'Always', 0x90)
+        never = utils.TL0_DataObject('never', 'Never', 0x97)
+        choice = utils.DataObjectChoice('choice', members=[always, never])
+        seq = utils.DataObjectSequence('seq', sequence=[always])
+        seq2 = seq + never + choice + utils.DataObjectSequence('other', sequence=[never])
+        self.assertEqual(seq2.sequence, [always, never, choice, never])
+        self.assertEqual(seq.sequence, [always])
+        seq += choice
+        self.assertEqual(seq.sequence, [always, choice])
+        with self.assertRaises(TypeError):
+            seq + 'foo'
+
+    def testSeqEncode(self):
+        """Encoding a sequence of plain DOs and choices"""
+        always = utils.TL0_DataObject('always', 'Always', 0x90)
+        choice = utils.DataObjectChoice('choice', members=[utils.TL0_DataObject('never', 'Never', 0x97)])
+        seq = utils.DataObjectSequence('seq', sequence=[always, choice])
+        decoded = seq.decode(b'\x90\x00\x97\x00')
+        self.assertEqual(decoded, ([{'always': None}, {'never': None}], b''))
+        self.assertEqual(seq.encode(decoded[0]), b'\x90\x00\x97\x00')
+        self.assertIsInstance(seq.encode(decoded[0]), bytes)
+        self.assertEqual(seq.encode_multi([decoded[0]] * 2), b'\x90\x00\x97\x00' * 2)
+
 class DecTestCase(unittest.TestCase):
 	# TS33.501 Annex C.4 test keys
 	hnet_pubkey_profile_b = "0272DA71976234CE833A6907425867B82E074D44EF907DFB4B3E21C1C2256EBCD1" # ID 27 in test file
@@ -115,6 +160,14 @@ class DecTestCase(unittest.TestCase):
 	def testDecAct_allSet(self):
 		self.assertEqual(utils.dec_act("ffff"), ['E-UTRAN NB-S1', 'E-UTRAN WB-S1', 'EC-GSM-IoT', 'GSM', 'GSM COMPACT', 'NG-RAN', 'UTRAN', 'cdma2000 1xRTT', 'cdma2000 HRPD'])
 
+	def testDecAct_truncated(self):
+		with self.assertRaises(ValueError):
+			utils.dec_act("80")
+		with self.assertRaises(ValueError):
+			utils.dec_act("800")
+		# anything beyond the first two bytes is ignored
+		self.assertEqual(utils.dec_act("8000ffff"), ["UTRAN"])
+
 	def testDecxPlmn_w_act(self):
 		expected = {'mcc': '295', 'mnc': '10', 'act': ["UTRAN"]}
 		self.assertEqual(utils.dec_xplmn_w_act("92f5018000"), expected)
@@ -172,6 +225,103 @@ class DecTestCase(unittest.TestCase):
 		msisdn_decoded = utils.dec_msisdn("ffffffffffffffffffffffffffffffffffffffff0bb121436587092143658709ffff")
 		self.assertEqual(msisdn_decoded, (1, 3, "12345678901234567890"))
 
+	def testH2i(self):
+		self.assertEqual(utils.h2i("00a1FF"), [0x00, 0xa1, 0xff])
+		# a trailing odd nibble is ignored
+		self.assertEqual(utils.h2i("00a1f"), [0x00, 0xa1])
+		self.assertEqual(utils.h2i(""), [])
+		with self.assertRaises(ValueError):
+			utils.h2i("00 a1")
+		with self.assertRaises(ValueError):
+			utils.h2i("0g")
+
+	def testH2s(self):
+		self.assertEqual(utils.h2s("414243"), "ABC")
+		# 0xff padding is removed, a trailing odd nibble is ignored
+		self.assertEqual(utils.h2s("41ff42ffff"), "AB")
+		self.assertEqual(utils.h2s("41424"), "AB")
+		with self.assertRaises(ValueError):
+			utils.h2s("41 42")
+
+	def testDecIccid(self):
+		self.assertEqual(utils.dec_iccid("98103200000000000000"), "89012300000000000000")
+		# lower case 'f' filler is stripped
+		self.assertEqual(utils.dec_iccid("981032000000000000f0"), "8901230000000000000")
+		# upper case 'F' filler and odd length input are passed through swap_nibbles() as-is
+		self.assertEqual(utils.dec_iccid("981032000000000000F0"), "8901230000000000000F")
+		self.assertEqual(utils.dec_iccid("98F1"), "891F")
+		self.assertEqual(utils.dec_iccid("a00"), "0a")
+
+	def testDecImsi(self):
+		self.assertEqual(utils.dec_imsi("080910101032547698"), "001010123456789")
+		# lower case 'f' filler is stripped
+		self.assertEqual(utils.dec_imsi("03091010ffffffffff"), "00101")
+		# upper case 'F' filler is kept, so the length no longer matches
+		self.assertEqual(utils.dec_imsi("03091010FFFFFFFFFF"), None)
+		self.assertEqual(utils.dec_imsi("0809101010325476F8"), "00101012345678F")
+		# odd length input
+		self.assertEqual(utils.dec_imsi("0809101010325476f"), None)
+		self.assertEqual(utils.dec_imsi("08"), None)
+
+	def testEncIccid(self):
+		self.assertEqual(utils.enc_iccid("8988211000000530082"), "988812010000500380f2")
+		self.assertEqual(utils.enc_iccid("89882110000005300811"), "98881201000050038011")
+		# upper case filler is kept as-is
+		self.assertEqual(utils.enc_iccid("898821100000053008F"), "988812010000500380fF")
+		with self.assertRaises(ValueError):
+			utils.enc_iccid("898821100000053008111")
+		with self.assertRaises(ValueError):
+			utils.enc_iccid("8988211000000530081111")
+
+	def testEncImsi(self):
+		self.assertEqual(utils.enc_imsi("001010123456789"), "080910101032547698")
+		self.assertEqual(utils.enc_imsi("00101"), "03091010ffffffffff")
+		self.assertEqual(utils.dec_imsi(utils.enc_imsi("0010101234567")), "0010101234567")
+		with self.assertRaises(ValueError):
+			utils.enc_imsi("0010101234567890")
+
+	def testIsHex(self):
+		self.assertTrue(utils.is_hex("1234"))
+		self.assertTrue(utils.is_hex("abcDEF"))
+		self.assertFalse(utils.is_hex(""))
+		self.assertFalse(utils.is_hex("123"))
+		self.assertFalse(utils.is_hex("zz"))
+		self.assertFalse(utils.is_hex("0x12"))
+		# whitespace separated hex is rejected
+		self.assertFalse(utils.is_hex("12 34"))
+		self.assertFalse(utils.is_hex("12 34 "))
+		self.assertFalse(utils.is_hex("12\t34\n"))
+		# min/max length
+		self.assertFalse(utils.is_hex("12", minlen=0))
+		self.assertTrue(utils.is_hex("abcdef", minlen=6))
+		self.assertFalse(utils.is_hex("abcdef", minlen=8))
+		self.assertTrue(utils.is_hex("abcdef", maxlen=6))
+		self.assertFalse(utils.is_hex("abcdef", maxlen=4))
+
+	def testSwMatch(self):
+		self.assertTrue(utils.sw_match("9000", "9000"))
+		self.assertFalse(utils.sw_match("63c5", "63c4"))
+		# '?' and 'x' wildcards, also next to a literal nibble
+		self.assertTrue(utils.sw_match("6a82", "6a8?"))
+		self.assertTrue(utils.sw_match("6a82", "??82"))
+		self.assertTrue(utils.sw_match("6a82", "6axx"))
+		self.assertTrue(utils.sw_match("63C5", "63cx"))
+		# the SW is matched case-insensitive, the pattern must be lower case
+		self.assertTrue(utils.sw_match("6A82", "6a82"))
+		self.assertFalse(utils.sw_match("6A82", "6A82"))
+		self.assertFalse(utils.sw_match("9000", "90XX"))
+
+	def testSwMatch_notFourChars(self):
+		# anything but a four character pattern / SW takes the character-wise comparison
+		self.assertTrue(utils.sw_match("90001", "9000"))
+		self.assertTrue(utils.sw_match("90", "90??"))
+		self.assertFalse(utils.sw_match("9000", "90000"))
+		self.assertFalse(utils.sw_match("90000", "90000"))
+		with self.assertRaises(IndexError):
+			utils.sw_match("900", "9000")
+		with self.assertRaises(IndexError):
+			utils.sw_match("9000", "900")
+
 class TestBerTlv(unittest.TestCase):
     def test_BerTlvTagDec(self):
         res = utils.bertlv_parse_tag(b'\x01')
@@ -236,6 +386,33 @@ class TestDgiTlv(unittest.TestCase):
         self.assertEqual(utils.dgi_parse_len(b'\xfe\x0b'), (254, b'\x0b'))
         self.assertEqual(utils.dgi_parse_len(b'\xff\x00\xff\x0b'), (255, b'\x0b'))
 
+class TestCardCommand(unittest.TestCase):
+    def test_match_cla(self):
+        cmd = utils.CardCommand('TEST', 0xA4, ['0X', '4X', '6X'])
+        # integer CLAs used to be formatted in decimal, so e.g. 0x4a was matched as '74'
+        for cla in [0x00, 0x41, 0x4a, 0x6f, '00', '41', '6F', '6f']:
+            self.assertTrue(cmd.match_cla(cla), cla)
+        for cla in [0x81, 0x10, 41, 'C0', '81']:
+            self.assertFalse(cmd.match_cla(cla), cla)
+
+    def test_match_cla_proprietary(self):
+        cmd = utils.CardCommand('TEST', 0xA4, ['8X', 'CX', 'EX'])
+        for cla in [0x81, 0xc5, 0xef, '81', 'C5', 'e0']:
+            self.assertTrue(cmd.match_cla(cla), cla)
+        for cla in [0x01, 0x41, 0xa0, '01', '41']:
+            self.assertFalse(cmd.match_cla(cla), cla)
+
+class TestJsonEncoder(unittest.TestCase):
+    def test_bytes(self):
+        self.assertEqual(json.dumps(b'\x01\xab', cls=utils.JsonEncoder), '"01ab"')
+        self.assertEqual(json.dumps(bytearray(b'\xff'), cls=utils.JsonEncoder), '"ff"')
+        self.assertEqual(json.dumps(BytesIO(b'\x01'), cls=utils.JsonEncoder), '"01"')
+
+    def test_subclass(self):
+        class MyBytes(bytes):
+            pass
+        self.assertEqual(json.dumps({'a': MyBytes(b'\x02')}, cls=utils.JsonEncoder), '{"a": "02"}')
+
 class TestLuhn(unittest.TestCase):
     def test_verify(self):
         utils.verify_luhn('8988211000000530082')